@@ -0,0 +1,52 @@
+from random import Random
+from time import perf_counter
+import json
+import os
+
+from models.backends import MemoryClient
+
+
+class FileBackend:
+    # The sqlite3 engine on a plain file, so disk-dependent settings can be measured without jester
+
+    max_connections = None
+
+    def __init__(self, path: str):
+        self.uri = "file:" + path
+
+    def open(self):
+        return MemoryClient(self.uri)
+
+
+def shipped_profile():
+    with open(os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "config.json")) as file:
+        return json.load(file)["bot"]["shared_config"]["STORAGE"]["profile"]
+
+
+def seed(users: int = 2000, infractions: int = 20000, notes: int = 5000, mutes: int = 500):
+    from models.moderations import Infraction, Note
+    from models.mutes import Mute
+
+    random = Random(0)
+    Infraction.bulk_create(dict(user=random.randrange(users), type=random.choice(("warn", "strike")), reason="spam",
+                                moderator=1, date=i) for i in range(infractions))
+    Note.bulk_create(dict(user=random.randrange(users), content="note " * 20, moderator=1, date=i)
+                     for i in range(notes))
+    Mute.bulk_create(dict(target=random.randrange(users), end_time=i) for i in range(mutes))
+
+
+def timed(operations):
+    # Runs each callable, returns the latency of every call in seconds
+    latencies = []
+    for operation in operations:
+        start = perf_counter()
+        operation()
+        latencies.append(perf_counter() - start)
+    return latencies
+
+
+def summary(name: str, latencies, elapsed: float):
+    latencies = sorted(latencies)
+    return "{:<12} {:>9.0f} ops/s   p50 {:7.3f}ms   p99 {:7.3f}ms".format(
+        name, len(latencies) / elapsed, latencies[len(latencies) // 2] * 1000,
+        latencies[int(len(latencies) * 0.99)] * 1000)
@@ -0,0 +1,63 @@
+# Ops/sec of opening a connection per query, as every model call did before the pool, against pooled connections.
+# Run from the repository root: python -m benchmarks.connection_pool [operations] [greenlets]
+
+from random import Random
+from time import perf_counter
+import os
+import sys
+import tempfile
+
+from benchmarks.common import FileBackend, seed, summary, timed
+from models.base import use_backend
+from models.pool import pool
+
+import gevent
+
+
+READ = "SELECT user, type, reason, moderator, date FROM infraction WHERE user = ?"
+WRITE = "INSERT INTO note (user, content, moderator, date) VALUES (?, ?, ?, ?)"
+
+
+def statements(count: int, users: int = 2000):
+    random = Random(2)
+    return [(READ, (random.randrange(users),)) if random.random() < 0.9 else
+            (WRITE, (random.randrange(users), "note", 1, 0)) for _ in range(count)]
+
+
+def per_query(backend, sql, values):
+    with backend.open() as client:
+        client.execute(sql, *values)
+        return client.fetch_all()
+
+
+def pooled(sql, values):
+    with pool.connection() as client:
+        return client.query(sql, *values)
+
+
+def run(count: int, greenlets: int, threaded: bool = None):
+    with tempfile.TemporaryDirectory() as directory:
+        backend = FileBackend(os.path.join(directory, "bench.db"))
+        use_backend(backend, profile={}, pool_size=5, threaded=bool(threaded))
+        seed()
+        if threaded is None:
+            operations = [lambda s=sql, v=values: per_query(backend, s, v) for sql, values in statements(count)]
+        else:
+            operations = [lambda s=sql, v=values: pooled(s, v) for sql, values in statements(count)]
+        start = perf_counter()
+        jobs = [gevent.spawn(timed, operations[i::greenlets]) for i in range(greenlets)]
+        gevent.joinall(jobs, raise_error=True)
+        elapsed = perf_counter() - start
+        use_backend("memory")  # Releases the file before the directory goes
+    return [latency for job in jobs for latency in job.value], elapsed
+
+
+def main(count: int = 20000, greenlets: int = 8):
+    print("{} statements over {} greenlets, 90% reads".format(count, greenlets))
+    print(summary("per query", *run(count, greenlets)))
+    print(summary("pooled", *run(count, greenlets, threaded=False)))
+    print(summary("pooled+thr", *run(count, greenlets, threaded=True)))
+
+
+if __name__ == "__main__":
+    main(*map(int, sys.argv[1:]))
@@ -0,0 +1,60 @@
+# Time and memory to turn fetched rows into model instances, the old per-field setattr instances against the
+# row-backed __slots__ ones. Run from the repository root: python -m benchmarks.materialise [rows]
+
+from random import Random
+from time import perf_counter
+import sys
+import tracemalloc
+
+from models.base import use_backend
+from models.moderations import Infraction
+from models.pool import pool
+
+
+class LegacyInfraction:
+    # Instances as models used to build them: a __dict__ filled with one setattr per field
+    _fields = [*Infraction._fields]
+
+    def __init__(self, args: tuple):
+        for name, value in zip(self._fields, args):
+            setattr(self, name, value)
+
+
+def rows(count: int):
+    random = Random(3)
+    use_backend("memory")
+    Infraction.bulk_create(dict(user=random.randrange(10 ** 17, 10 ** 18), type=random.choice(("warn", "strike")),
+                                reason="spam", moderator=10 ** 17, date=1560000000 + i) for i in range(count))
+    with pool.connection() as client:
+        return client.query("SELECT {} FROM infraction".format(Infraction._select))
+
+
+def measure(model, fetched):
+    start = perf_counter()
+    instances = [*map(model, fetched)]
+    built = perf_counter() - start
+
+    start = perf_counter()
+    for instance in instances:
+        instance.user, instance.type, instance.date
+    read = perf_counter() - start
+
+    del instances
+    tracemalloc.start()
+    instances = [*map(model, fetched)]
+    size = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    return built, read, size / len(fetched)
+
+
+def main(count: int = 100000):
+    fetched = rows(count)
+    print("{} rows".format(count))
+    for name, model in (("legacy", LegacyInfraction), ("row-backed", Infraction)):
+        built, read, size = measure(model, fetched)
+        print("{:<11} build {:7.1f}ms   read 3 fields {:7.1f}ms   {:5.0f} bytes per instance".format(
+            name, built * 1000, read * 1000, size))
+
+
+if __name__ == "__main__":
+    main(*map(int, sys.argv[1:]))
@@ -0,0 +1,103 @@
+# Memory retained per cached message by LoggingPlugin, gateway events against MessageSnapshot records.
+# Run from the repository root: python -m benchmarks.message_cache [messages]
+
+from collections import deque
+from datetime import datetime, timedelta
+from random import Random
+from types import SimpleNamespace
+import sys
+import tracemalloc
+
+from plugins.logging import MessageSnapshot
+from utils.lru import MessageCache
+
+from disco.gateway.events import MessageCreate
+from disco.types.channel import Channel
+from disco.types.guild import Guild
+
+
+GUILD_ID = 437048931827056642
+CHANNEL_ID = 440221190875774976
+OLD_BOUND = 100  # max_message_cache the deque of events was sized for
+WORDS = "the a to and of is it that you for on this just but with what so like can not have bot code repl " \
+        "python error help please thanks does anyone know how why my run when i".split()
+
+
+def client():
+    # Just enough state for message.guild to resolve, as it does through the bot's real state
+    fake = SimpleNamespace(state=SimpleNamespace(guilds={}, channels={}))
+    fake.state.guilds[GUILD_ID] = Guild(id=GUILD_ID, name="Replit", icon="a" * 32, client=fake)
+    fake.state.channels[CHANNEL_ID] = Channel(id=CHANNEL_ID, guild_id=GUILD_ID, name="general", type=0,
+                                              client=fake)
+    return fake
+
+
+def payloads(count: int, seed: int = 0):
+    # Shaped like MESSAGE_CREATE dispatches: mostly short chat, some long posts, mentions, embeds and files
+    random = Random(seed)
+    start = datetime(2019, 8, 1)
+    for i in range(count):
+        author = {"id": str(10 ** 17 + random.randrange(500)), "username": "user" + str(random.randrange(500)),
+                  "discriminator": "{:04d}".format(random.randrange(10000)), "avatar": "b" * 32}
+        length = random.choice((3, 8, 15, 40)) if random.random() < 0.95 else random.randrange(100, 400)
+        data = {
+            "id": str(6 * 10 ** 17 + i), "channel_id": str(CHANNEL_ID), "guild_id": str(GUILD_ID), "type": 0,
+            "author": author, "member": {"roles": [str(10 ** 17 + random.randrange(20))], "nick": None,
+                                         "joined_at": start.isoformat(), "deaf": False, "mute": False},
+            "content": " ".join(random.choice(WORDS) for _ in range(length)),
+            "timestamp": (start + timedelta(seconds=i)).isoformat(), "edited_timestamp": None, "tts": False,
+            "mention_everyone": False, "pinned": False, "mention_roles": [], "mentions": [], "embeds": [],
+            "attachments": [], "nonce": str(6 * 10 ** 17 + i)
+        }
+        if random.random() < 0.1:
+            data["mentions"].append(dict(author, id=str(10 ** 17 + random.randrange(500))))
+        if random.random() < 0.05:
+            data["embeds"].append({"type": "link", "url": "https://repl.it/@user/project",
+                                   "title": "Project", "description": "A repl" * 10,
+                                   "thumbnail": {"url": "https://repl.it/public/images/og.png"}})
+        if random.random() < 0.03:
+            data["attachments"].append({"id": str(6 * 10 ** 17 + i), "filename": "image.png", "size": 120000,
+                                        "url": "https://cdn.discordapp.com/attachments/1/2/image.png",
+                                        "proxy_url": "https://media.discordapp.net/attachments/1/2/image.png",
+                                        "width": 800, "height": 600})
+        yield data
+
+
+def retained(count: int, keep):
+    events = client()
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    cache = keep(MessageCreate.create(data, events) for data in payloads(count))
+    size = tracemalloc.get_traced_memory()[0] - before
+    tracemalloc.stop()
+    del cache
+    return size / count
+
+
+def keep_events(events):
+    cache = deque()
+    for event in events:
+        cache.append(event)
+    return cache
+
+
+def keep_snapshots(events):
+    cache = MessageCache(sys.maxsize)
+    for event in events:
+        cache.put(event.channel_id, event.id, MessageSnapshot.from_message(event))
+    return cache
+
+
+def main(count: int = 10000):
+    event_bytes = retained(count, keep_events)
+    snapshot_bytes = retained(count, keep_snapshots)
+    print("{} messages".format(count))
+    print("  gateway events:    {:8.0f} bytes per message".format(event_bytes))
+    print("  message snapshots: {:8.0f} bytes per message ({:.1f}x smaller)".format(
+        snapshot_bytes, event_bytes / snapshot_bytes))
+    print("  max_message_cache fitting the RAM of {} events: {}".format(
+        OLD_BOUND, int(OLD_BOUND * event_bytes / snapshot_bytes)))
+
+
+if __name__ == "__main__":
+    main(*map(int, sys.argv[1:]))
@@ -0,0 +1,73 @@
+# Throughput of the profanity check over a chat-like corpus, a match per word and pattern against the combined
+# single-pass matcher. Run from the repository root: python -m benchmarks.profanity [messages]
+
+from random import Random
+from time import perf_counter
+import json
+import os
+import re
+import sys
+
+from plugins.filter import compile_profanity
+
+
+WORDS = "the a to and of is it that you for on this just but with what so like can not have bot code repl " \
+        "python error help please thanks does anyone know how why my run when i class function import " \
+        "shell clicked server discord message".split()
+PROFANE = "ass shit fuck bitch dick".split()
+
+
+def config():
+    with open(os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "configs",
+                           "filter.json")) as file:
+        return json.load(file)
+
+
+def corpus(count: int, seed: int = 0):
+    # Mostly short clean chat, some long and multi-line posts, a profane word in about one message in fifty
+    random = Random(seed)
+    messages = []
+    for _ in range(count):
+        length = random.choice((3, 6, 10, 20)) if random.random() < 0.9 else random.randrange(40, 200)
+        words = [random.choice(WORDS) for _ in range(length)]
+        if random.random() < 0.02:
+            words[random.randrange(length)] = random.choice(PROFANE)
+        separators = [" " if random.random() < 0.95 else "\n" for _ in words]
+        messages.append("".join(word + separator for word, separator in zip(words, separators)).capitalize())
+    return messages
+
+
+def main(count: int = 20000):
+    settings = config()
+    table = {ord(char): None for char in settings["discord_syntax"] + settings["extra_text"]}
+    tokenised = [message.lower().translate(table).split() for message in corpus(count)]
+
+    patterns = [re.compile(pattern) for pattern in settings["regex"]]
+
+    def per_pattern(words):
+        for word in words:
+            for index, pattern in enumerate(patterns):
+                if pattern.match(word):
+                    return index
+        return None
+
+    profanity = compile_profanity(settings["regex"])
+
+    def single_pass(words):
+        match = profanity.search("\n".join(words))
+        return None if match is None else int(match.lastgroup[1:])
+
+    results = {}
+    print("{} messages, {} patterns".format(count, len(patterns)))
+    for name, check in (("per pattern", per_pattern), ("single pass", single_pass)):
+        start = perf_counter()
+        results[name] = [*map(check, tokenised)]
+        elapsed = perf_counter() - start
+        print("{:<12} {:9.0f} messages/s".format(name, count / elapsed))
+    assert results["per pattern"] == results["single pass"], "Matchers disagree"
+    print("both flagged {} messages with the same first pattern".format(
+        sum(result is not None for result in results["single pass"])))
+
+
+if __name__ == "__main__":
+    main(*map(int, sys.argv[1:]))
@@ -0,0 +1,76 @@
+# Replays a mixed read/write moderation workload against each SQLite pragma profile on a file database.
+# Run from the repository root: python -m benchmarks.storage_profiles [operations] [greenlets] [rounds]
+
+from random import Random
+from time import perf_counter, time
+import os
+import sys
+import tempfile
+
+from benchmarks.common import FileBackend, seed, shipped_profile, summary, timed
+from models.base import use_backend
+from models.moderations import Infraction, InfractionCount, Note
+from models.mutes import Mute
+from models.writebehind import writes
+
+import gevent
+
+
+PROFILES = {
+    "default": {},  # Rollback journal, synchronous = FULL
+    "wal": {"journal_mode": "WAL", "synchronous": "NORMAL"},
+    "wal+cache": {"journal_mode": "WAL", "synchronous": "NORMAL", "cache_size": -16000, "temp_store": "MEMORY"},
+    "wal+mmap": {"journal_mode": "WAL", "synchronous": "NORMAL", "cache_size": -16000, "temp_store": "MEMORY",
+                 "mmap_size": 268435456},
+    "shipped": shipped_profile()
+}
+
+
+def workload(count: int, users: int = 2000, seed: int = 1):
+    # Roughly what the bot sees: history lookups dominate, infractions, notes and mutes are written in between
+    random = Random(seed)
+    mix = [
+        (40, lambda u: Infraction.find(Infraction.user == u)),
+        (20, lambda u: InfractionCount.of(u)),
+        (10, lambda u: [*Note.iter(Note.user == u)]),
+        (5, lambda u: Infraction.count(Infraction.type == "warn", Infraction.date <= u * 10)),
+        (10, lambda u: Infraction.create(user=u, type="warn", reason="spam", moderator=1, date=int(time()))),
+        (5, lambda u: Note.create(user=u, content="note", moderator=1, date=int(time()))),
+        (5, lambda u: Mute.create(target=u, end_time=int(time()) + 600)),
+        (5, lambda u: Mute.delete_where(Mute.target == u))
+    ]
+    weights = [weight for weight, _ in mix]
+    operations = []
+    for _ in range(count):
+        operation = random.choices(mix, weights)[0][1]
+        user = random.randrange(users)
+        operations.append(lambda operation=operation, user=user: operation(user))
+    return operations
+
+
+def run(profile: dict, count: int, greenlets: int):
+    with tempfile.TemporaryDirectory() as directory:
+        use_backend(FileBackend(os.path.join(directory, "bench.db")), profile=profile, pool_size=5)
+        seed()
+        operations = workload(count)
+        start = perf_counter()
+        jobs = [gevent.spawn(timed, operations[i::greenlets]) for i in range(greenlets)]
+        gevent.joinall(jobs, raise_error=True)
+        elapsed = perf_counter() - start
+        use_backend("memory")  # Releases the file before the directory goes
+    return [latency for job in jobs for latency in job.value], elapsed
+
+
+def main(count: int = 5000, greenlets: int = 8, rounds: int = 5):
+    writes.configure(enabled=False)  # Measure the profile, not the write-behind queue
+    print("{} operations over {} greenlets, median of {} rounds".format(count, greenlets, rounds))
+    results = {name: [] for name in PROFILES}
+    for _ in range(rounds):  # Interleaved, so drift in the machine's load hits every profile alike
+        for name, profile in PROFILES.items():
+            results[name].append(run(profile, count, greenlets))
+    for name, runs in results.items():
+        print(summary(name, *sorted(runs, key=lambda result: result[1])[len(runs) // 2]))
+
+
+if __name__ == "__main__":
+    main(*map(int, sys.argv[1:]))
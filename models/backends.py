@@ -0,0 +1,62 @@
+from itertools import count
+import sqlite3
+
+from jester import JesterClient
+
+
+class SQLiteBackend:
+    max_connections = None
+
+    def open(self):
+        return JesterClient()
+
+
+class MemoryClient:
+
+    def __init__(self, uri: str):
+        self.uri = uri
+        self.connection = None
+        self.cursor = None
+
+    def __enter__(self):
+        self.connection = sqlite3.connect(self.uri, uri=True, isolation_level=None)  # Pool issues BEGIN/COMMIT
+        self.cursor = self.connection.cursor()
+        return self
+
+    def execute(self, sql: str, *values):
+        self.cursor.execute(sql, values)
+
+    def fetch_all(self):
+        return self.cursor.fetchall()
+
+    def __exit__(self, *_):
+        self.connection.close()
+
+
+class MemoryBackend:
+    # Same engine and SQL as the on-disk backend, minus the disk. Shared-cache connections lock whole tables,
+    # so the pool is held to one connection instead of failing with "database table is locked".
+    max_connections = 1
+    _ids = count()
+
+    def __init__(self, name: str = None):
+        self.uri = "file:{}?mode=memory&cache=shared".format(name or "hoothoot-{}".format(next(self._ids)))
+        self._keeper = sqlite3.connect(self.uri, uri=True)  # The database is dropped with its last connection
+
+    def open(self):
+        return MemoryClient(self.uri)
+
+
+BACKENDS = {
+    "sqlite": SQLiteBackend,
+    "memory": MemoryBackend
+}
+
+
+def get_backend(backend):
+    if isinstance(backend, str):
+        try:
+            return BACKENDS[backend]()
+        except KeyError:
+            raise ValueError("Unknown storage backend " + repr(backend))
+    return backend
@@ -1,17 +1,34 @@
 from collections import OrderedDict
+from importlib import import_module
+import pkgutil
 
-from jester import JesterClient
+import models as package
+from models import migrations
+from models.cache import cache
+from models.pool import pool
+from models.writebehind import writes
+
+
+MAX_VARIABLES = 999  # SQLITE_MAX_VARIABLE_NUMBER on older builds
+MAX_STATEMENTS = 256  # Per model, IN lists of varying length would otherwise grow the memo forever
 
 
 class Column:
 
-    __slots__ = "type", "optional", "default", "unique"
+    __slots__ = "type", "optional", "default", "unique", "index", "position"
 
-    def __init__(self, typ: str, optional: bool = False, default: str = None, unique = False):
+    def __init__(self, typ: str, optional: bool = False, default: str = None, unique = False, index: bool = False):
         self.type = typ
         self.optional = optional
         self.default = default
         self.unique = unique
+        self.index = index
+        self.position = None
+
+    def __get__(self, instance, owner):
+        if instance is None:
+            return self
+        return instance._row[self.position]
 
     def compile(self):
         text = self.type
@@ -28,100 +45,407 @@ class Column:
     def __eq__(self, other: str):
         return self, other
 
+    def __lt__(self, other):
+        return self, other, "<"
+
+    def __le__(self, other):
+        return self, other, "<="
+
+    def __gt__(self, other):
+        return self, other, ">"
+
+    def __ge__(self, other):
+        return self, other, ">="
+
+    def in_(self, values):
+        return self, tuple(values), "IN"
+
+    def is_null(self):
+        return self, None, "IS"
+
+    def is_not_null(self):
+        return self, None, "IS NOT"
+
+    def desc(self):
+        return self, "DESC"
+
 
 class BaseMeta(type):
 
+    registry = []
+    bootstrapped = False
+
     def __new__(mcs, name, bases, clsattrs):
 
         if name != 'Base':
             table_name = clsattrs.get("TABLE_NAME", name.lower())
             _fields = OrderedDict({name: arg for name, arg in clsattrs.items() if isinstance(arg, Column)})
 
-            with JesterClient() as client:
-                client.execute("SELECT name FROM sqlite_master WHERE type = 'table' AND name NOT LIKE 'sqlite_%'")
-                all_db = [l[0] for l in client.fetch_all()]
-                if table_name not in all_db:
-                    columns = " ".join("{} {},".format(name, val.compile()) for name, val in _fields.items())[:-1]
-                    client.execute("CREATE TABLE {} ({})".format(table_name, columns))
+            for position, col in enumerate(_fields.values()):
+                col.position = position
 
             clsattrs["_fields"] = _fields
+            clsattrs["_columns"] = tuple(_fields.values())
+            clsattrs["_primary"] = next((i for i, col in enumerate(_fields.values()) if col.unique), None)
+            clsattrs["_statements"] = {}
+            clsattrs["_select"] = ", ".join(_fields)  # Explicit column list, so columns added later can't shift rows
+            clsattrs["__slots__"] = ()
+            clsattrs["_indexes"] = mcs._collect_indexes(table_name, _fields, clsattrs.get("INDEXES", ()))
             clsattrs['table_name'] = table_name
 
-        return super().__new__(mcs, name, bases, clsattrs)
+        cls = super().__new__(mcs, name, bases, clsattrs)
+        if name != 'Base':
+            mcs.registry.append(cls)
+            if mcs.bootstrapped:  # Defined after startup, e.g. by a reloaded plugin
+                bootstrap([cls])
+        return cls
+
+    @staticmethod
+    def _collect_indexes(table_name, fields, composite):
+        indexes = OrderedDict()
+        for columns in [(name,) for name, col in fields.items() if col.index] + [tuple(c) for c in composite]:
+            if not all(name in fields for name in columns):
+                raise ValueError("Index on unknown columns: " + ", ".join(columns))
+            indexes["ix_{}_{}".format(table_name, "_".join(columns))] = columns
+        return indexes
+
+    def create_statements(cls, tables, indexes, columns):
+        statements, drift = [], []
+        if cls.table_name not in tables:
+            definition = " ".join("{} {},".format(name, val.compile()) for name, val in cls._fields.items())[:-1]
+            statements.append("CREATE TABLE {} ({})".format(cls.table_name, definition))
+        else:
+            for name, col in cls._fields.items():
+                if name in columns.get(cls.table_name, ()):
+                    continue
+                if (col.optional or col.default is not None) and not col.unique:
+                    statements.append("ALTER TABLE {} ADD COLUMN {} {}".format(cls.table_name, name, col.compile()))
+                else:
+                    drift.append("{}.{}".format(cls.table_name, name))
+        existing = indexes.get(cls.table_name, set())
+        for index in existing - set(cls._indexes):
+            statements.append("DROP INDEX " + index)
+        for index, columns in cls._indexes.items():
+            if index not in existing:
+                statements.append("CREATE INDEX {} ON {} ({})".format(index, cls.table_name, ", ".join(columns)))
+        return statements, drift
+
+
+def _read_schema(client):
+    tables, indexes = set(), {}
+    for typ, name, table in client.query("SELECT type, name, tbl_name FROM sqlite_master "
+                                         "WHERE type IN ('table', 'index')"):
+        if typ == "table":
+            tables.add(name)
+        elif name.startswith("ix_"):
+            indexes.setdefault(table, set()).add(name)
+
+    columns = {}
+    for table, column in client.query("SELECT m.name, p.name FROM sqlite_master m "
+                                      "JOIN pragma_table_info(m.name) p WHERE m.type = 'table'"):
+        columns.setdefault(table, set()).add(column)
+    return tables, indexes, columns
+
+
+def _plan(models, schema):
+    statements, drift = [], []
+    for model in models:
+        model_statements, model_drift = model.create_statements(*schema)
+        statements.extend(model_statements)
+        drift.extend(model_drift)
+    return statements, drift
+
+
+def bootstrap(models=None):
+    # Reads the schema once for every model; the write transaction only happens when something is out of date
+    if models is None:
+        if BaseMeta.bootstrapped:
+            return
+        for module in pkgutil.iter_modules(package.__path__):  # Migrations may touch any model's table
+            import_module(package.__name__ + "." + module.name)
+        models = BaseMeta.registry
+
+    with pool.connection() as client:
+        statements, drift = _plan(models, _read_schema(client))
+        version = client.query("PRAGMA user_version")[0][0]
+        todo = migrations.pending(version)
+
+        if drift and not todo:
+            raise migrations.SchemaDrift("Columns missing with no pending migration: " + ", ".join(drift))
+
+        if statements or todo:
+            with pool.transaction():
+                for sql in statements:
+                    client.execute(sql)
+                for _, migrate in todo:
+                    migrate(client)
+                if todo:
+                    client.execute("PRAGMA user_version = {:d}".format(migrations.latest_version()))
+                    _, drift = _plan(models, _read_schema(client))
+                    if drift:
+                        raise migrations.SchemaDrift("Migrations left columns missing: " + ", ".join(drift))
+
+    BaseMeta.bootstrapped = True
+
+
+def use_backend(backend, **options):
+    # Points every model at another storage backend (e.g. "memory" for benchmarks) and builds its schema
+    writes.flush()
+    pool.configure(backend=backend, **options)
+    cache.clear()
+    BaseMeta.bootstrapped = False
+    bootstrap()
 
 
 class Base(metaclass=BaseMeta):
 
+    __slots__ = "_row",
+
     table_name: str
     _fields: dict
+    _columns: tuple
+    _primary: int
+    _statements: dict
+    _select: str
+    _indexes: dict
+
+    WRITE_BEHIND = False  # Opt-in per model, only takes effect when write-behind is enabled in the config
+    CACHE = False  # Opt-in per model, reads are served from models.cache until a write to the model
 
     def __init__(self, args: tuple):
-        for name, value in zip(self._fields, args):
-            setattr(self, name, value)
+        self._row = tuple(args)
 
     def __iter__(self):
-        for field in self._fields:
-            yield getattr(self, field)
+        return iter(self._row)
     
     @classmethod
-    def create(cls, **fields):
-        fields = OrderedDict(fields)
-
+    def _validate(cls, fields):
         if not all(name in fields for name, col in cls._fields.items() if not col.optional):
             raise ValueError("Not all required columns were provided")
         if not all(name in cls._fields for name in fields):
             raise ValueError("Provided unknown columns")
 
-        with JesterClient() as client:
-            values = ", ".join("?" for _ in fields)
-            client.execute("INSERT INTO {} ({}) VALUES ({})".format(cls.table_name, ", ".join(fields), values),
-                           *fields.values())
+    @staticmethod
+    def _sync():
+        if writes.dirty:
+            writes.sync()
+
+    @classmethod
+    def transaction(cls):
+        return pool.transaction()
+
+    @classmethod
+    def _invalidate(cls):
+        if cls.CACHE:  # Once committed, reads still in flight see the generation change and don't cache
+            pool.after_transaction(lambda: cache.invalidate(cls))
+
+    @classmethod
+    def _fetch(cls, sql, values):
+        cached = cls.CACHE and not pool.in_transaction()  # Uncommitted reads could be rolled back
+        if cached:
+            key = cls, sql, tuple(values)
+            rows = cache.get(key)
+            if rows is not None:
+                return rows
+            generation = cache.generation(cls)
+
+        with pool.connection() as client:
+            rows = client.query(sql, *values)
+        if cached:
+            cache.put(key, rows, generation)
+        return rows
+
+    @classmethod
+    def _statement(cls, operation: str, shape: tuple = (), extra: tuple = ()):
+        # Generated SQL is memoised per model and query shape, identical strings also let every pooled
+        # connection reuse its prepared statement instead of re-parsing
+        key = operation, shape, extra
+        sql = cls._statements.get(key)
+        if sql is None:
+            if len(cls._statements) >= MAX_STATEMENTS:
+                cls._statements.clear()
+            sql = cls._statements[key] = cls._compile(operation, shape, extra)
+        return sql
+
+    @classmethod
+    def _compile(cls, operation, shape, extra):
+        names = [*cls._fields]
+        if operation == "insert":
+            row_sql = "(" + ", ".join("?" for _ in shape) + ")"
+            return "INSERT INTO {} ({}) VALUES {}".format(cls.table_name, ", ".join(shape),
+                                                         ", ".join(row_sql for _ in range(extra[0])))
+
+        clauses = []
+        for position, op, arity in shape:
+            if op == "IN":
+                clauses.append("{} IN ({})".format(names[position], ", ".join("?" for _ in range(arity))))
+            elif op in ("IS", "IS NOT"):
+                clauses.append("{} {} NULL".format(names[position], op))
+            else:
+                clauses.append("{} {} ?".format(names[position], op))
+        where = " WHERE " + " AND ".join(clauses) if clauses else ""
+
+        if operation == "find":
+            order_by, limit, offset = extra
+            sql = "SELECT {} FROM {}{} ORDER BY ".format(cls._select, cls.table_name, where)
+            sql += ", ".join([names[position] + direction for position, direction in order_by] + ["rowid"])
+            if limit is not None:
+                sql += " LIMIT {:d}".format(limit)
+            if offset:
+                sql += (" LIMIT -1" if limit is None else "") + " OFFSET {:d}".format(offset)
+            return sql
+        elif operation == "iter":
+            return "SELECT rowid, {} FROM {}{} rowid > ? ORDER BY rowid LIMIT {:d}".format(
+                cls._select, cls.table_name, where + " AND" if where else " WHERE", extra[0])
+        elif operation == "count":
+            return "SELECT COUNT(*) FROM " + cls.table_name + where
+        elif operation == "exists":
+            return "SELECT 1 FROM {}{} LIMIT 1".format(cls.table_name, where)
+        elif operation == "pluck":
+            return "SELECT {} FROM {}{}".format(names[extra[0]], cls.table_name, where)
+        elif operation == "count_by":
+            return "SELECT {0}, COUNT(*) FROM {1}{2} GROUP BY {0}".format(names[extra[0]], cls.table_name, where)
+        elif operation == "delete":
+            return "DELETE FROM " + cls.table_name + where
+        raise ValueError("Unknown operation " + operation)
+
+    @classmethod
+    def create(cls, **fields):
+        fields = OrderedDict(fields)
+        cls._validate(fields)
+
+        if cls.WRITE_BEHIND and writes.enabled:  # Cached reads flush the queue first, which invalidates
+            return writes.put(cls, fields)
+
+        with pool.transaction() as client:
+            cls._invalidate()
+            client.execute(cls._statement("insert", tuple(fields), (1,)), *fields.values())
+
+    @classmethod
+    def bulk_create(cls, rows):
+        groups = OrderedDict()
+        for fields in rows:
+            cls._validate(fields)
+            groups.setdefault(tuple(fields), []).append(fields)
+
+        cls._sync()
+        with pool.transaction() as client:
+            cls._invalidate()
+            for names, group in groups.items():
+                per_chunk = max(1, MAX_VARIABLES // len(names))
+                for start in range(0, len(group), per_chunk):
+                    chunk = group[start:start + per_chunk]
+                    client.execute(cls._statement("insert", names, (len(chunk),)),
+                                   *(fields[name] for fields in chunk for name in names))
 
     @classmethod
     def _create_query(cls, querys):
-        if isinstance(querys[0], tuple):
-            matched = {}
-            for query in querys:
-                for name, col in cls._fields.items():
-                    if query[0] is col:
-                        matched[name] = query[1]
-        else:
-            primary = next(name for name, col in cls._fields.items() if col.unique)
-            matched = {primary: querys[0]}
+        if not querys:
+            return (), ()
+        if not isinstance(querys[0], tuple):
+            if cls._primary is None:
+                raise ValueError(cls.__name__ + " has no primary key")
+            return ((cls._primary, "=", 0),), [querys[0]]
 
-        return " AND ".join("{} = ?".format(name) for name in matched), matched.values()
+        shape, values = [], []
+        for query in querys:
+            position = cls._position(query[0])
+            op = query[2] if len(query) > 2 else "="
+            if query[1] is None and op == "=":
+                op = "IS"
+            if op == "IN":
+                shape.append((position, op, len(query[1])))
+                values.extend(query[1])
+            elif op in ("IS", "IS NOT"):
+                shape.append((position, op, 0))
+            else:
+                shape.append((position, op, 0))
+                values.append(query[1])
+        return tuple(shape), values
 
     @classmethod
-    def find_all(cls):
-        with JesterClient() as client:
-            client.execute("SELECT * FROM " + cls.table_name)
-            return [*map(cls, client.fetch_all())]
-    
+    def _order(cls, order_by=None):
+        if order_by is None:
+            return ()
+        elif isinstance(order_by, Column) or (isinstance(order_by, tuple) and isinstance(order_by[-1], str)):
+            order_by = order_by,
+        return tuple((cls._position(term[0]), " " + term[1]) if isinstance(term, tuple) else (cls._position(term), "")
+                     for term in order_by)
+
+    @classmethod
+    def _position(cls, column: Column):
+        if column.position is None or cls._columns[column.position] is not column:
+            raise ValueError("Column does not belong to " + cls.__name__)
+        return column.position
+
+    @classmethod
+    def find_all(cls, **options):
+        return cls.find(**options)
+
+    @classmethod
+    def find(cls, *querys, order_by=None, limit: int = None, offset: int = None):
+        cls._sync()
+        shape, values = cls._create_query(querys)
+        return [*map(cls, cls._fetch(cls._statement("find", shape, (cls._order(order_by), limit, offset)), values))]
+
+    @classmethod
+    def iter(cls, *querys, batch_size: int = 500):
+        cls._sync()
+        shape, values = cls._create_query(querys)
+        sql = cls._statement("iter", shape, (batch_size,))
+        last = -1 << 63
+        while True:
+            with pool.connection() as client:  # Released between batches so iteration never pins a connection
+                rows = client.query(sql, *values, last)
+            for row in rows:
+                yield cls(row[1:])
+            if len(rows) < batch_size:
+                return
+            last = rows[-1][0]
+
+    @classmethod
+    def find_one(cls, *query, order_by=None, offset: int = None):
+        return cls.find(*query, order_by=order_by, limit=1, offset=offset)[0]
+
+    @classmethod
+    def count(cls, *querys):
+        cls._sync()
+        shape, values = cls._create_query(querys)
+        return cls._fetch(cls._statement("count", shape), values)[0][0]
+
     @classmethod
-    def find(cls, *querys):
-        query, values = cls._create_query(querys)
-        sql = "SELECT * FROM {} WHERE ".format(cls.table_name) + query
-        with JesterClient() as client:
-            client.execute(sql, *values)
-            return [*map(cls, client.fetch_all())]
+    def exists(cls, *querys):
+        cls._sync()
+        shape, values = cls._create_query(querys)
+        return bool(cls._fetch(cls._statement("exists", shape), values))
 
     @classmethod
-    def find_one(cls, *query):
-        return cls.find(*query)[0]
+    def count_by(cls, column: Column, *querys):
+        cls._sync()
+        shape, values = cls._create_query(querys)
+        return dict(cls._fetch(cls._statement("count_by", shape, (cls._position(column),)), values))
+
+    @classmethod
+    def pluck(cls, column: Column, *querys):
+        # One column of every matching row, unordered and ungrouped so the planner is free to pick any index
+        cls._sync()
+        shape, values = cls._create_query(querys)
+        return [row[0] for row in cls._fetch(cls._statement("pluck", shape, (cls._position(column),)), values)]
 
     @classmethod
     def delete(cls, *querys):
-        query, values = cls._create_query(querys)
-        sql = "DELETE FROM {} WHERE ".format(cls.table_name) + query
-        with JesterClient() as client:
-            client.execute(sql, *values)
+        return cls.delete_where(*querys)
+
+    @classmethod
+    def delete_where(cls, *querys):
+        shape, values = cls._create_query(querys)
+        if not shape:
+            raise ValueError("Refusing to delete without a condition")
+        cls._sync()
+        with pool.transaction() as client:
+            cls._invalidate()
+            client.execute(cls._statement("delete", shape), *values)
+            return client.query("SELECT changes()")[0][0]
 
     def delete_self(self):
-        query = list(zip(self._fields.values(), self))
-        to_remove = []
-        for i, q in enumerate(query):
-            if q[1] is None:
-                to_remove.append(i)
-        for i in to_remove:
-            query.pop(i)
-        self.delete(*query)
+        self.delete(*(col == value for col, value in zip(self._columns, self)))
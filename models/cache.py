@@ -0,0 +1,63 @@
+from collections import OrderedDict
+from time import monotonic
+
+
+class QueryCache:
+
+    def __init__(self, max_size: int = 1024, ttl: float = 300):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.entries = OrderedDict()  # (model, sql, values) -> (expires, result)
+        self.by_model = {}
+        self.generations = {}  # model -> invalidation count, lets a read tell a write landed while it ran
+        self.hits = 0
+        self.misses = 0
+
+    def configure(self, max_size: int = None, ttl: float = None):
+        if max_size is not None:
+            self.max_size = max_size
+        if ttl is not None:
+            self.ttl = ttl
+
+    def get(self, key):
+        entry = self.entries.get(key)
+        if entry is None or entry[0] < monotonic():
+            self.misses += 1
+            return None
+        self.entries.move_to_end(key)
+        self.hits += 1
+        return entry[1]
+
+    def generation(self, model):
+        return self.generations.get(model, 0)
+
+    def put(self, key, result, generation: int = None):
+        if generation is not None and generation != self.generation(key[0]):
+            return  # Invalidated while the query ran, the result may predate the write
+        self.entries[key] = monotonic() + self.ttl, result
+        self.entries.move_to_end(key)
+        self.by_model.setdefault(key[0], set()).add(key)
+        while len(self.entries) > self.max_size:
+            old, _ = self.entries.popitem(last=False)
+            self.by_model[old[0]].discard(old)
+
+    def invalidate(self, model):
+        self.generations[model] = self.generation(model) + 1
+        for key in self.by_model.pop(model, ()):
+            self.entries.pop(key, None)
+
+    def clear(self):
+        self.entries.clear()
+        self.by_model.clear()
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            "size": len(self.entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit rate": self.hits / lookups if lookups else 0.0
+        }
+
+
+cache = QueryCache()
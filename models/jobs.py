@@ -0,0 +1,9 @@
+from models.base import Base, Column
+
+
+class Job(Base):
+    INDEXES = [("kind", "key")]
+
+    kind = Column("TEXT")
+    key = Column("INTEGER")
+    due = Column("INTEGER", index=True)
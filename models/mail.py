@@ -2,7 +2,9 @@ from models.base import Base, Column
 
 
 class MailRoom(Base):
+    CACHE = True
+
     user = Column("INTEGER", unique=True)
-    channel = Column("INTEGER")
+    channel = Column("INTEGER", index=True)
     date = Column("INTEGER")
     message = Column("TEXT")
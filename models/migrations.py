@@ -0,0 +1,49 @@
+from collections import OrderedDict
+
+
+class SchemaDrift(Exception):
+    pass
+
+
+migrations = OrderedDict()
+
+
+def migration(version: int):
+    def wrapper(func):
+        if version in migrations:
+            raise ValueError("Duplicate migration version {}".format(version))
+        if migrations and version < next(reversed(migrations)):
+            raise ValueError("Migrations must be registered in order")
+        migrations[version] = func
+        return func
+    return wrapper
+
+
+def latest_version():
+    return next(reversed(migrations), 0)
+
+
+def pending(current: int):
+    return [(version, func) for version, func in migrations.items() if version > current]
+
+
+# Migrations run inside the bootstrap transaction after tables, additive columns and indexes have been
+# reconciled, and receive the pooled client. Append new ones with the next version number, never edit old ones.
+
+@migration(1)
+def analyze_secondary_indexes(client):
+    client.execute("ANALYZE")
+
+
+@migration(2)
+def backfill_infraction_counts(client):
+    client.execute("DELETE FROM infraction_count")
+    client.execute("INSERT INTO infraction_count SELECT user, SUM(type = 'warn'), SUM(type = 'strike'), MAX(date) "
+                   "FROM infraction GROUP BY user")
+
+
+@migration(3)
+def schedule_existing_mutes(client):
+    client.execute("INSERT INTO job (kind, key, due) SELECT 'unmute', target, MAX(end_time) FROM mute "
+                   "WHERE target NOT IN (SELECT key FROM job WHERE kind = 'unmute') GROUP BY target "
+                   "HAVING MAX(end_time) > CAST(strftime('%s', 'now') AS INTEGER)")
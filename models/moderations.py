@@ -1,16 +1,92 @@
-from models.base import Base, Column
+from models.base import Base, Column, MAX_VARIABLES
+from models.pool import pool
+from models.writebehind import writes
 
 
 class Infraction(Base):
+    WRITE_BEHIND = True
+    INDEXES = [("user", "type"), ("type", "date")]
+
     user = Column("INTEGER")
     type = Column("TEXT")
     reason = Column("TEXT", optional=True)
     moderator = Column("INTEGER")
     date = Column("INTEGER")
 
+    # Every insert and delete keeps InfractionCount in step within the same transaction
+
+    @classmethod
+    def create(cls, **fields):
+        if cls.WRITE_BEHIND and writes.enabled:
+            return super().create(**fields)  # Counted when the queue is flushed through bulk_create
+        cls.bulk_create([fields])
+
+    @classmethod
+    def bulk_create(cls, rows):
+        rows = list(rows)
+        with cls.transaction():
+            super().bulk_create(rows)
+            InfractionCount.refresh({fields["user"] for fields in rows})
+
+    @classmethod
+    def delete_where(cls, *querys):
+        with cls.transaction():
+            users = {*cls.pluck(cls.user, *querys)}  # GROUP BY would pull the planner onto the (user, type) index
+            deleted = super().delete_where(*querys)
+            InfractionCount.refresh(users)
+        return deleted
+
+
+class InfractionCount(Base):
+    TABLE_NAME = "infraction_count"
+
+    user = Column("INTEGER", unique=True)
+    warns = Column("INTEGER", default="0")
+    strikes = Column("INTEGER", default="0")
+    last_infraction = Column("INTEGER", optional=True)
+
+    TALLY = "SELECT user, SUM(type = 'warn'), SUM(type = 'strike'), MAX(date) FROM infraction{} GROUP BY user"
+
+    @classmethod
+    def of(cls, user: int):
+        try:
+            return cls.find_one(user)
+        except IndexError:
+            return cls((user, 0, 0, None))
+
+    @classmethod
+    def refresh(cls, users):
+        users = [*users]
+        with cls.transaction() as client:
+            cls._invalidate()
+            for start in range(0, len(users), MAX_VARIABLES):
+                chunk = users[start:start + MAX_VARIABLES]
+                cls.delete_where(cls.user.in_(chunk))
+                client.execute("INSERT INTO infraction_count " + cls.TALLY.format(
+                    " WHERE user IN ({})".format(", ".join("?" for _ in chunk))), *chunk)
+
+    @classmethod
+    def check(cls):
+        cls._sync()
+        with pool.connection() as client:
+            # Users whose row differs, is missing or is stale, each counted once
+            return client.query("SELECT COUNT(*) FROM (SELECT user FROM (SELECT * FROM infraction_count EXCEPT {0}) "
+                                "UNION SELECT user FROM ({0} EXCEPT SELECT * FROM infraction_count))".format(
+                                    cls.TALLY.format("")))[0][0]
+
+    @classmethod
+    def rebuild(cls):
+        cls._sync()
+        with cls.transaction() as client:
+            cls._invalidate()
+            client.execute("DELETE FROM infraction_count")
+            client.execute("INSERT INTO infraction_count " + cls.TALLY.format(""))
+
 
 class Note(Base):
-    user = Column("INTEGER")
+    WRITE_BEHIND = True
+
+    user = Column("INTEGER", index=True)
     content = Column("TEXT")
     moderator = Column("INTEGER")
     date = Column("INTEGER")
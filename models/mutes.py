@@ -2,5 +2,7 @@ from models.base import Base, Column
 
 
 class Mute(Base):
-    target = Column("INTEGER")
-    end_time = Column("INTEGER")
+    WRITE_BEHIND = True
+
+    target = Column("INTEGER", index=True)
+    end_time = Column("INTEGER", index=True)
@@ -0,0 +1,216 @@
+from contextlib import contextmanager
+from time import time
+
+from models.backends import BACKENDS, get_backend
+
+import gevent
+from gevent.event import AsyncResult
+from gevent.lock import BoundedSemaphore
+from gevent.queue import LifoQueue, Empty
+from gevent.threadpool import ThreadPool
+
+
+class PoolTimeout(Exception):
+    pass
+
+
+def compile_pragma(name: str, value):
+    if not name.isidentifier():
+        raise ValueError("Invalid pragma name " + repr(name))
+    if not isinstance(value, int) and not str(value).isidentifier():
+        raise ValueError("Invalid value for pragma " + name)
+    return "PRAGMA {} = {}".format(name, value)
+
+
+class Connection:
+    # Each connection owns one worker thread and runs every call there, so blocking sqlite3 I/O only parks the
+    # calling greenlet while the hub keeps serving heartbeats and other events.
+
+    __slots__ = "_context", "_client", "_worker", "last_used"
+
+    def __init__(self, backend, profile: dict, threaded: bool = True):
+        self._worker = ThreadPool(1) if threaded else None
+        self._context = backend.open()
+        self._client = self._run(self._context.__enter__)  # Opened in the worker, sqlite3 is thread-affine
+        self.last_used = time()
+        for name, value in profile.items():  # Per-connection settings, applied once instead of per query
+            self.execute(compile_pragma(name, value))
+
+    def _run(self, func, *args):
+        if self._worker is None:
+            return func(*args)
+        return self._worker.apply(func, args)
+
+    def _query(self, sql, *values):
+        self._client.execute(sql, *values)
+        return self._client.fetch_all()
+
+    def execute(self, sql: str, *values):
+        self._run(self._client.execute, sql, *values)
+
+    def fetch_all(self):
+        return self._run(self._client.fetch_all)
+
+    def query(self, sql: str, *values):
+        return self._run(self._query, sql, *values)
+
+    def healthy(self):
+        try:
+            self.query("SELECT 1")
+        except Exception:
+            return False
+        return True
+
+    def close(self):
+        try:
+            self._run(self._context.__exit__, None, None, None)
+        except Exception:
+            pass
+        if self._worker is not None:
+            self._worker.kill()
+
+
+class ConnectionPool:
+
+    def __init__(self, pool_size: int = 5, pool_timeout: float = 10, health_check_interval: float = 60,
+                 profile: dict = None, threaded: bool = True, backend="sqlite"):
+        self.pool_size = pool_size
+        self.pool_timeout = pool_timeout
+        self.health_check_interval = health_check_interval
+        self.profile = profile or {}
+        self.threaded = threaded
+        self.backend = get_backend(backend)
+        self._slots = BoundedSemaphore(self._capacity())
+        self._idle = LifoQueue()
+        self._owners = {}  # greenlet -> [Connection, transaction depth, after transaction callbacks]
+
+    def _capacity(self):
+        return min(self.pool_size, self.backend.max_connections or self.pool_size)
+
+    def configure(self, pool_size: int = None, pool_timeout: float = None, health_check_interval: float = None,
+                  profile: dict = None, threaded: bool = None, backend=None):
+        capacity = self._capacity()
+        if profile is not None and profile != self.profile:
+            for name, value in profile.items():
+                compile_pragma(name, value)
+            self.profile = profile
+            self.close()  # Idle connections were opened with the old profile
+        if threaded is not None and threaded != self.threaded:
+            self.threaded = threaded
+            self.close()
+        if backend is not None and not (isinstance(backend, str) and isinstance(self.backend, BACKENDS.get(backend, ()))):
+            if self._owners:
+                raise RuntimeError("Can not switch backends while connections are checked out")
+            self.backend = get_backend(backend)
+            self.close()
+        if pool_timeout is not None:
+            self.pool_timeout = pool_timeout
+        if health_check_interval is not None:
+            self.health_check_interval = health_check_interval
+        if pool_size is not None:
+            self.pool_size = pool_size
+        if self._capacity() != capacity:
+            if self._owners:
+                raise RuntimeError("Can not resize the pool while connections are checked out")
+            self._slots = BoundedSemaphore(self._capacity())
+
+    def _acquire(self):
+        if not self._slots.acquire(timeout=self.pool_timeout):
+            raise PoolTimeout("Timed out waiting for a database connection")
+        try:
+            try:
+                conn = self._idle.get_nowait()
+            except Empty:
+                return Connection(self.backend, self.profile, self.threaded)
+            if time() - conn.last_used > self.health_check_interval and not conn.healthy():
+                conn.close()
+                return Connection(self.backend, self.profile, self.threaded)
+            return conn
+        except BaseException:
+            self._slots.release()
+            raise
+
+    def _release(self, conn: Connection, broken: bool = False):
+        if broken:
+            conn.close()
+        else:
+            conn.last_used = time()
+            self._idle.put(conn)
+        self._slots.release()
+
+    @contextmanager
+    def connection(self):
+        current = gevent.getcurrent()
+        held = self._owners.get(current)
+        if held is not None:  # Re-entrant within a greenlet, so nested calls share a transaction
+            yield held[0]
+            return
+
+        conn = self._acquire()
+        self._owners[current] = [conn, 0, []]
+        broken = False
+        try:
+            yield conn
+        except Exception:
+            broken = not conn.healthy()
+            raise
+        finally:
+            del self._owners[current]
+            self._release(conn, broken)
+
+    def in_transaction(self):
+        held = self._owners.get(gevent.getcurrent())
+        return held is not None and held[1] > 0
+
+    def after_transaction(self, callback):
+        held = self._owners.get(gevent.getcurrent())
+        if held is not None and held[1]:
+            held[2].append(callback)
+        else:
+            callback()
+
+    @contextmanager
+    def transaction(self):
+        with self.connection() as client:
+            held = self._owners[gevent.getcurrent()]
+            if held[1]:
+                held[1] += 1
+                try:
+                    yield client
+                finally:
+                    held[1] -= 1
+                return
+
+            # Transactions are the write path, taking the write lock up front lets SQLite's busy handler wait
+            # for it. A deferred BEGIN that reads first fails at once under WAL if another connection commits.
+            client.execute("BEGIN IMMEDIATE")
+            held[1] = 1
+            try:
+                yield client
+            except BaseException:
+                client.execute("ROLLBACK")
+                raise
+            else:
+                client.execute("COMMIT")
+            finally:
+                held[1] = 0
+                callbacks, held[2] = held[2], []
+                for callback in callbacks:
+                    callback()
+
+    def close(self):
+        while True:
+            try:
+                self._idle.get_nowait().close()
+            except Empty:
+                break
+
+
+def submit(func, *args, **kwargs) -> AsyncResult:
+    # Non-blocking form of any ORM call, e.g. submit(Infraction.count, Infraction.user == uid).get()
+    result = AsyncResult()
+    gevent.spawn(func, *args, **kwargs).link(result)
+    return result
+
+
+pool = ConnectionPool()
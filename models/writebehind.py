@@ -0,0 +1,115 @@
+from collections import OrderedDict
+import atexit
+import logging
+import sqlite3
+
+from models.pool import pool
+
+import gevent
+from gevent.event import Event
+from gevent.lock import RLock
+
+
+log = logging.getLogger(__name__)
+
+NON_TRANSIENT = sqlite3.IntegrityError,  # Retrying these can never succeed, the offending rows are dropped
+
+
+class WriteBehind:
+
+    def __init__(self, enabled: bool = False, max_pending: int = 1000, flush_interval: float = 0.5):
+        self.enabled = enabled
+        self.max_pending = max_pending
+        self.flush_interval = flush_interval
+        self.pending = OrderedDict()  # model -> [fields, ...]
+        self.size = 0
+        self._wakeup = Event()
+        self._lock = RLock()
+        self._greenlet = None
+
+    def configure(self, enabled: bool = None, max_pending: int = None, flush_interval: float = None):
+        if enabled is not None:
+            self.enabled = enabled
+        if max_pending is not None:
+            self.max_pending = max_pending
+        if flush_interval is not None:
+            self.flush_interval = flush_interval
+
+    def put(self, model, fields):
+        if self.size >= self.max_pending:  # Queue is full, the caller pays for the flush instead of growing it
+            self.flush()
+        self.pending.setdefault(model, []).append(fields)
+        self.size += 1
+        if self._greenlet is None or self._greenlet.dead:
+            self._greenlet = gevent.spawn(self._run)
+        self._wakeup.set()
+
+    def _run(self):
+        while True:
+            self._wakeup.wait()
+            gevent.sleep(self.flush_interval)
+            self._wakeup.clear()
+            try:
+                self.flush()
+            except Exception:
+                log.exception("Failed to flush write-behind queue, retrying")
+                self._wakeup.set()
+
+    def sync(self):
+        # Read path: a failed batch stays queued for the flusher to retry, the read goes ahead without it
+        try:
+            self.flush()
+        except Exception:
+            log.exception("Failed to flush write-behind queue before a read")
+
+    @property
+    def dirty(self):
+        return bool(self.size) or self._lock.locked()
+
+    def flush(self):
+        if pool.in_transaction():
+            # An in-flight flush may be waiting on the write lock this transaction holds, so waiting for it here
+            # would deadlock. Its rows aren't visible until it commits either way, queued ones wait for the flusher.
+            if not self._lock.acquire(blocking=False):
+                return
+        else:
+            self._lock.acquire()  # Readers wait for an in-flight flush, so they always see their own writes
+        try:
+            self._write()
+        finally:
+            self._lock.release()
+
+    def _write(self):
+        if not self.size:
+            return
+        pending, self.pending, self.size = self.pending, OrderedDict(), 0
+        try:
+            with pool.transaction() as client:
+                if self._insert(client, pending) is not None:  # Isolate the bad rows, keep the rest
+                    for model, rows in pending.items():
+                        for fields in rows:
+                            error = self._insert(client, {model: [fields]})
+                            if error is not None:
+                                log.error("Dropped write-behind %s row %r: %s", model.__name__, dict(fields), error)
+        except BaseException:
+            for model, rows in self.pending.items():  # The failed batch goes back ahead of rows queued since
+                pending.setdefault(model, []).extend(rows)
+            self.pending = pending
+            self.size = sum(map(len, pending.values()))
+            raise
+
+    @staticmethod
+    def _insert(client, batch):
+        # Savepoints undo a failed batch without ending the transaction, which may be the caller's
+        client.execute("SAVEPOINT write_behind")
+        try:
+            for model, rows in batch.items():
+                model.bulk_create(rows)
+        except NON_TRANSIENT as error:
+            client.execute("ROLLBACK TO write_behind")
+            return error
+        finally:
+            client.execute("RELEASE write_behind")
+
+writes = WriteBehind()
+atexit.register(writes.flush)
@@ -1,7 +1,9 @@
 from datetime import datetime
 
+from models.cache import cache
 from models.mutes import Mute
 from utils.base import HootPlugin
+from utils.outbox import outbox
 from utils.paginator import PaginatorEmbed
 
 from disco.bot import CommandLevels
@@ -112,16 +114,22 @@ class AdminPlugin(HootPlugin):
                               "Disabled" if command in self._commands.values() else "Enabled"
             )
 
+        stats = cache.stats()
+        log_stats = outbox.stats()
         description = """Statistics:
           - Up time: {}
           - Ping: {}ms
+          - Model cache: {} entries, {} hits, {} misses ({:.0%} hit rate)
+          - Log outbox: {} queued, {} embeds sent in {} messages, {} dropped, {} failed
 
           Plugins:
           {}
 
           Commands of enabled plugins:
           {}
-        """.format(uptime, ping, plugin_table.compile(), command_table.compile())
+        """.format(uptime, ping, stats["size"], stats["hits"], stats["misses"], stats["hit rate"],
+                   log_stats["queued"], log_stats["sent"], log_stats["messages"], log_stats["dropped"],
+                   log_stats["failed"], plugin_table.compile(), command_table.compile())
         broken_up = description.split("\n")
         final_description = [""]
         for part in broken_up:
@@ -135,10 +143,9 @@ class AdminPlugin(HootPlugin):
 
     @HootPlugin.command("mutes", level=CommandLevels.MOD)
     def show_mutes(self, event):
-        mutes = Mute.find_all()
         mute_table = MessageTable()
         mute_table.set_header("Member", "Unmute")
-        for mute in mutes:
+        for mute in Mute.iter():
             mute_table.add(
                 "<@{}>".format(mute.target),
                 datetime.fromtimestamp(mute.end_time).strftime("%b %d, %I:%M %p")
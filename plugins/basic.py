@@ -54,10 +54,10 @@ class ModPlugin(HootPlugin):
         event.msg.add_reaction("👍")
         if length:
             seconds = sum(length)
-            self.spawn_later(seconds, self.unmute, target)
             self.log_action("Muted", "Muted {t.mention} for {s} seconds. Moderator: {e.author.mention}", target,
                             s=seconds, e=event)
             Mute.create(target=target.id, end_time=int(time() + seconds))
+            self.schedule_unmute(target.id, time() + seconds)
         else:
             Mute.create(target=target.id, end_time=time() * 2)  # This should ensure they never get unmuted, in theory?
 
@@ -71,7 +71,7 @@ class ModPlugin(HootPlugin):
         ***Required Values***
         > __target__ **The user's full discord name, mention, or ID**
         """
-        self.unmute(target, force=True)
+        self.unmute(target)
         event.msg.add_reaction("👍")
 
     @HootPlugin.command("badavatar", "<target:member>", level=CommandLevels.MOD)
@@ -102,7 +102,7 @@ class ModPlugin(HootPlugin):
         except Timeout:
             return
 
-        self.unmute(target, force=True)
+        self.unmute(target)
         dm.send_message(self.config["avatar_release"])
 
     @HootPlugin.command("jammer", "<target:member>", level=CommandLevels.TRUSTED)
@@ -7,19 +7,26 @@ from utils.base import HootPlugin, CommandLevels
 from disco.types import Message
 
 
+def compile_profanity(patterns):
+    # One alternation anchored at each word (one word per line), so a message is scanned once and the engine
+    # still tries the patterns in config order. Each pattern is a named group, p<index>, to report which matched.
+    return re.compile("^(?:{})".format("|".join(
+        "(?P<p{}>{})".format(i, pattern) for i, pattern in enumerate(patterns))), re.MULTILINE)
+
+
 class FilterPlugin(HootPlugin):
 
     def load(self, ctx):
-        for i, match in enumerate(self.config["regex"]):
-            self.config["regex"][i] = re.compile(match)
+        self.profanity = compile_profanity(self.config["regex"])
 
         self.table = {}
         for char in self.config['discord_syntax'] + self.config['extra_text']:
             self.table[ord(char)] = None
 
     def get_words(self, sentence: str):
-        content = sentence.lower().translate(self.table)
-        return [s for s in content.split(" ") if s]
+        # Any whitespace separates words, so a word on its own line is checked like any other. Words never hold
+        # a newline, which keeps the one-word-per-line scan in check_bad_words aligned with word boundaries.
+        return sentence.lower().translate(self.table).split()
 
     def do_checks(self, msg: Message):
         if msg.channel.parent_id == self.config["mail_parent"] or msg.channel.is_dm:
@@ -33,9 +40,11 @@ class FilterPlugin(HootPlugin):
         return True, None
 
     def check_bad_words(self, msg: Message):
-        for word in self.get_words(msg.content):
-            for reg in self.config['regex']:
-                assert reg.match(word) is None, "Watch your profanity {mention}"
+        match = self.profanity.search("\n".join(self.get_words(msg.content)))
+        if match is not None:
+            self.log.info("Message %s matched profanity pattern %r", msg.id,
+                          self.config["regex"][int(match.lastgroup[1:])])
+        assert match is None, "Watch your profanity {mention}"
 
     def check_mentions(self, msg: Message):
         assert len(msg.mentions) <= self.config['max_mentions'], "Calm down, don't spam mentions {mention} {mention}"
@@ -1,25 +1,64 @@
 from time import time
 from datetime import datetime
 
-from models.moderations import Infraction, Note
+from models.base import MAX_VARIABLES
+from models.moderations import Infraction, InfractionCount, Note
 from models.mutes import Mute
 from utils.base import HootPlugin
 from utils.paginator import PaginatorEmbed
+from utils.scheduler import scheduler
 
+from disco.api.http import APIException
 from disco.bot import CommandLevels
 from disco.types.message import MessageEmbed
 from disco.util.snowflake import to_datetime
+from gevent import sleep
+from gevent.event import Event
+from gevent.pool import Pool
 
 
 class InfractionPlugin(HootPlugin):
 
-    @HootPlugin.schedule(60 * 60)
+    def load(self, ctx):
+        super().load(ctx)
+        self.expiry_wakeup = Event()
+        self.expiry_due = None
+        self.spawn(self.expire_infractions)
+
+    def next_expiry(self):
+        due = []
+        for kind, lifetime in self.config['expiry'].items():
+            try:  # Oldest infraction of each type, straight off the (type, date) index
+                oldest = Infraction.find_one(Infraction.type == kind, order_by=Infraction.date)
+            except IndexError:
+                continue
+            due.append(oldest.date + lifetime)
+        return min(due, default=None)
+
     def expire_infractions(self):
-        for infraction in Infraction.find_all():
-            if infraction.type == "warn" and time() - infraction.date > 7.884e+6:
-                infraction.delete_self()
-            elif infraction.type == "strike" and time() - infraction.date > 1.577e+7:
-                infraction.delete_self()
+        backoff = 5
+        while True:
+            try:
+                now = time()
+                with Infraction.transaction():
+                    for kind, lifetime in self.config['expiry'].items():
+                        Infraction.delete_where(Infraction.type == kind, Infraction.date <= now - lifetime)
+
+                self.expiry_wakeup.clear()  # Before the lookup, so an infraction created meanwhile still wakes us
+                self.expiry_due = None
+                self.expiry_due = due = self.next_expiry()
+            except Exception:
+                self.log.exception("Failed to expire infractions, retrying in %ds", backoff)
+                sleep(backoff)
+                backoff = min(backoff * 2, 300)
+                continue
+            backoff = 5
+            self.expiry_wakeup.wait(None if due is None else max(due - time(), 0))
+
+    def wake_expiry(self):
+        # A new infraction never expires before the current oldest one, so only an idle loop needs waking
+        if self.expiry_due is None:
+            self.expiry_wakeup.set()
 
     @HootPlugin.command("history", "<member:member>", level=CommandLevels.MOD)
     def target_history(self, event, member):
@@ -47,11 +86,11 @@ class InfractionPlugin(HootPlugin):
             dm("", embed=embed)
 
     def get_history(self, member, show_mods: bool):
-        infractions = Infraction.find(Infraction.user == member.id)
-        total_warns = len([i for i in infractions if i.type == "warn"])
+        counts = InfractionCount.of(member.id)
+        infractions = Infraction.find(Infraction.user == member.id) if counts.last_infraction is not None else []
+        total_warns = counts.warns
         active_warns = total_warns % self.config['warns_to_strike']
-        active_strikes = len([i for i in infractions if i.type == "strike"]) \
-                         + total_warns // self.config['warns_to_strike']
+        active_strikes = counts.strikes + total_warns // self.config['warns_to_strike']
 
         embed = MessageEmbed()
         embed.title = member.name + "'s History"
@@ -124,6 +163,7 @@ class InfractionPlugin(HootPlugin):
                 date=int(time())
             )
 
+        self.wake_expiry()
         event.msg.add_reaction("👍")
         dm = lambda *x: self.dm(member.user.open_dm(), *x)
 
@@ -141,8 +181,7 @@ class InfractionPlugin(HootPlugin):
             self.log_action("Strike", "{t.mention} was striked, no reason was provided, by {m.mention}",
                             member, e=event.author)
 
-        if len(Infraction.find(Infraction.user == member.id,
-                               Infraction.type == "strike")) == self.config['strike_to_ban']:
+        if InfractionCount.of(member.id).strikes == self.config['strike_to_ban']:
             member.ban()
         else:
             self.execute_action(member, self.config['auto_actions']['strike'])
@@ -176,6 +215,7 @@ class InfractionPlugin(HootPlugin):
                 date=int(time())
             )
 
+        self.wake_expiry()
         event.msg.add_reaction("👍")
         dm = lambda *x: self.dm(member.user.open_dm(), *x)
 
@@ -188,8 +228,7 @@ class InfractionPlugin(HootPlugin):
             self.log_action("Warn", "{t.mention} was warned, no reason was provided, by {m.mention}",
                             member, m=event.author)
 
-        if not len(Infraction.find(Infraction.user == member.id,
-                                   Infraction.type == 'warn')) % self.config['warns_to_strike']:
+        if not InfractionCount.of(member.id).warns % self.config['warns_to_strike']:
             dm(self.config['msgs']['strike_auto'].format(length=self.config['auto_actions']['strike']['mute'] // 60))
             self.execute_action(member, self.config['auto_actions']['strike'])
         else:
@@ -207,14 +246,28 @@ class InfractionPlugin(HootPlugin):
 
         > __ICIN__ **The infraction's ID, check history if unsure**
         """
-        for i, infraction in enumerate(Infraction.find(Infraction.user == member.id)):
-            if i == ICIN:
-                infraction.delete_self()
-                event.msg.add_reaction("👍")
-                break
+        try:
+            infraction = Infraction.find_one(Infraction.user == member.id, offset=ICIN) if ICIN >= 0 else None
+        except IndexError:
+            infraction = None
+
+        if infraction is not None:
+            infraction.delete_self()
+            event.msg.add_reaction("👍")
         else:
             event.msg.reply("ICIN does not exist for that user, sorry.")
 
+    @HootPlugin.command("recount", level=CommandLevels.ADMIN)
+    def rebuild_counts(self, event):
+        """
+        ***The Recount Command***
+
+        This command will check the cached warn and strike totals against every infraction, and rebuild them from scratch.
+        """
+        inconsistent = InfractionCount.check()
+        InfractionCount.rebuild()
+        event.msg.reply("Rebuilt infraction counters, {} were inconsistent.".format(inconsistent))
+
     @HootPlugin.command("note", "<member:member> [note:str...]", level=CommandLevels.MOD)
     def append_note(self, event, member, note: str = None):
         """
@@ -238,47 +291,52 @@ class InfractionPlugin(HootPlugin):
             )
             event.msg.add_reaction("👍")
         else:
-            notes = Note.find(Note.user == member.id)
             note_list = [""]
-            for note in notes:
+            for note in Note.iter(Note.user == member.id):
                 if len("\n\n" + note.content + note_list[-1]) > 2048:
                     note_list.append(note.content)
                 else:
                     note_list[-1] += ("\n\n" if note_list[-1] else "") + note.content
 
-            if not notes:
+            if not note_list[-1]:
                 note_list[0] = "No notes exist for this user"
 
             PaginatorEmbed(event, note_list, title="Notes for {}".format(member.name), color=0x6832E3)
 
     @HootPlugin.listen("Ready")
     def schedule_unmutes(self, _):
-        mutes = Mute.find_all()
-        unmutes = {}
-        for mute in mutes:
-            if time() >= mute.end_time:
-                mute.delete_self()
-                if mute.target not in unmutes:
-                    unmutes[mute.target] = True,
-            else:
-                unmutes[mute.target] = False, int(mute.end_time - time())
+        # Future unmutes are persisted by the scheduler, so only mutes that ran out while offline need work here
+        start = time()
+        expired = [*{mute.target for mute in Mute.find(Mute.end_time <= start, order_by=Mute.end_time)}]
+        with Mute.transaction():
+            Mute.delete_where(Mute.end_time <= start)
+            still_muted = set()
+            for i in range(0, len(expired), MAX_VARIABLES):
+                still_muted.update(Mute.count_by(Mute.target, Mute.target.in_(expired[i:i + MAX_VARIABLES])))
+        targets = [target for target in expired if target not in still_muted]
 
         def remove_mute(user: int):
-            self.client.api.guilds_members_roles_remove(
-                self.config['GUILD_ID'],
-                user,
-                self.config["MUTE_ROLE"]
-            )
-            return Mute.delete(Mute.target == user)
-
-        for target, doit in unmutes.items():
-            if doit[0]:
-                self.client.api.guilds_members_roles_remove(self.config['GUILD_ID'], target, self.config["MUTE_ROLE"])
-            else:
-                self.spawn_later(doit[1], remove_mute, target)
+            try:  # The API client waits out rate limit buckets itself, the pool bounds how many calls are queued
+                self.client.api.guilds_members_roles_remove(self.config['GUILD_ID'], user, self.config["MUTE_ROLE"])
+            except APIException:
+                return False
+            return True
+
+        scheduler.start()  # Loads persisted jobs, so the cancels and lookups below see them
+        scheduler.cancel_many("unmute", targets)
+        for user in still_muted:  # Their job must cover the longest mute left, not the one that just ran out
+            if scheduler.pending("unmute", user) is None:
+                self.schedule_unmute(user, Mute.find_one(Mute.target == user, order_by=Mute.end_time.desc()).end_time)
+        removed = sum(Pool(self.config['reconcile_concurrency']).imap_unordered(remove_mute, targets))
+        scheduler.register("unmute", self.expire_mute)  # Held back until now so jobs due at startup aren't lifted twice
+        elapsed = time() - start
+        self.log.info("Mute reconciliation lifted %d of %d expired mutes in %.2fs", removed, len(targets), elapsed)
+        if targets:
+            self.log_action("Mute Reconciliation", "Lifted {r} of {n} mutes that expired while offline in {s:.2f}s",
+                            r=removed, n=len(targets), s=elapsed)
 
     def execute_action(self, member, action):
         if "mute" in action:
             member.add_role(self.config["MUTE_ROLE"])
-            self.spawn_later(action['mute'], self.unmute, member)
             Mute.create(target=member.id, end_time=int(time() + action['mute']))
+            self.schedule_unmute(member.id, time() + action['mute'])
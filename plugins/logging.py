@@ -1,7 +1,10 @@
-from collections import defaultdict, deque
 from datetime import datetime
+from sys import intern
 
 from utils.base import HootPlugin
+from utils.journal import MessageJournal
+from utils.lru import LRUCache, MessageCache
+from utils.outbox import outbox
 
 from disco.types.message import MessageEmbed
 from holster.emitter import Priority
@@ -20,6 +23,35 @@ def space_name(name: str):
 to_add = set()
 
 
+class MessageSnapshot:
+    # The few fields delete and edit logging read back, instead of the whole gateway event with its channel,
+    # member and embeds attached
+
+    __slots__ = "author_id", "avatar_url", "content", "attachments", "timestamp", "guild_id"
+
+    def __init__(self, author_id: int, avatar_url: str, content: str, attachments: int, timestamp: str,
+                 guild_id: int):
+        self.author_id = author_id
+        self.avatar_url = avatar_url
+        self.content = content
+        self.attachments = attachments
+        self.timestamp = timestamp
+        self.guild_id = guild_id
+
+    @classmethod
+    def from_message(cls, message):
+        # Interned since every message by the same author carries an identical, fairly long avatar URL
+        return cls(message.author.id, intern(message.author.avatar_url), message.content, len(message.attachments),
+                   message.timestamp.isoformat(), message.guild.id if message.guild else None)
+
+    def to_record(self):
+        return [getattr(self, field) for field in self.__slots__]
+
+    @property
+    def author_mention(self):
+        return "<@{}>".format(self.author_id)
+
+
 def logging_wrapper(*event_names: str, **kwargs):
     def function_wrapper(func):
         def wrapper(self, event):
@@ -42,7 +74,11 @@ def logging_wrapper(*event_names: str, **kwargs):
                     embed.description += "**" + key.title() + ":** " + value + "\n"
                 embed.description += "\n"
 
-            self.client.api.channels_messages_create(self.config["logging_channel"], " ", embed=embed)
+            if "file" in data:  # Attachments can't be coalesced, so these go out on their own
+                self.client.api.channels_messages_create(self.config["logging_channel"], embed=embed,
+                                                         attachment=data["file"])
+            else:
+                outbox.post(self.config["logging_channel"], embed)
 
         for event in event_names:
             HootPlugin.listen(event, priority=Priority.BEFORE, **kwargs)(wrapper)
@@ -55,64 +91,71 @@ def logging_wrapper(*event_names: str, **kwargs):
 class LoggingPlugin(HootPlugin):
 
     def load(self, ctx):
-        self.msg_cache = defaultdict(lambda: deque(maxlen=self.config['max_message_cache']))
-        self.channel_cache = deque(maxlen=self.config["max_channel_cache"])
-        self.voice_cache = deque(maxlen=self.config['max_voice_cache'])
+        self.msg_cache = MessageCache(self.config['max_message_cache'])
+        self.channel_cache = LRUCache(self.config["max_channel_cache"])
+        self.voice_cache = LRUCache(self.config['max_voice_cache'])
+        journal = self.config.get("journal", {})
+        self.journal = None
+        if journal.get("enabled"):
+            self.journal = MessageJournal(journal.get("path", "message_journal"), journal.get("retention", 604800))
+
+    def unload(self, ctx):
+        if self.journal is not None:
+            self.journal.close()
+        super().unload(ctx)
 
     def get_msg(self, channel: int, msg_id: int):
-        return next((m for m in self.msg_cache[channel] if m.id == msg_id), None)
+        message = self.msg_cache.get(msg_id, channel)
+        if message is None and self.journal is not None:  # Fell out of the in-memory window
+            record = self.journal.get(msg_id)
+            message = record and MessageSnapshot(*record)
+        return message
 
     def get_channel(self, channel: int):
-        return next((c for c in self.channel_cache if c.id == channel), None)
+        return self.channel_cache.get(channel)
 
     def get_voice(self, user_id: int):
-        return next((v for v in self.voice_cache if v.user.id == user_id), None)
+        return self.voice_cache.get(user_id)
 
     @HootPlugin.listen("MessageUpdate")
     @HootPlugin.listen("MessageCreate")
     def update_cache(self, event):
-        old_event = self.get_msg(event.channel_id, event.id)
-        if old_event:
-            self.msg_cache[event.channel_id].remove(old_event)
-        else:
-            if not self.get_channel(event.channel_id):
-                self.channel_cache.append(event.channel)
-        self.msg_cache[event.channel_id].append(event)
+        if event.channel_id not in self.channel_cache:
+            self.channel_cache.put(event.channel_id, event.channel)
+        snapshot = MessageSnapshot.from_message(event)
+        self.msg_cache.put(event.channel_id, event.id, snapshot)
+        if self.journal is not None:
+            self.journal.append(event.id, snapshot.to_record())
 
     @HootPlugin.listen("ChannelCreate")
     @HootPlugin.listen("ChannelUpdate")
     def update_channel(self, event):
-        old_channel = self.get_channel(event.id)
-        if old_channel:
-            self.channel_cache.remove(old_channel)
-        self.channel_cache.append(event)
+        self.channel_cache.put(event.id, event)
 
     @HootPlugin.listen("VoiceStateUpdate")
     def update_voice_channel(self, event):
-        old_state = self.get_voice(event.user.id)
-        if old_state is not None:
-            self.voice_cache.remove(old_state)
         if event.channel_id:
-            self.voice_cache.append(event)
+            self.voice_cache.put(event.user.id, event)
+        else:
+            self.voice_cache.pop(event.user.id, None)
 
     @logging_wrapper("MessageDelete")
     def log_msg_delete(self, event):
 
-        old_message = self.get_msg(event.channel_id, event.id)
+        old_message = self.msg_cache.pop(event.id) or self.get_msg(event.channel_id, event.id)
 
         if old_message:
-            self.msg_cache[event.channel_id].remove(old_message)
             return {
-                "link": "https://discordapp.com/channels/" + "/".join(map(str, (old_message.guild.id,
+                "link": "https://discordapp.com/channels/" + "/".join(map(str, (old_message.guild_id,
                                                                                 event.channel_id, event.id))),
-                "thumbnail": old_message.author.avatar_url,
+                "thumbnail": old_message.avatar_url,
                 "parts": [
                     {
                         "channel": "<#" + str(event.channel_id) + ">",
-                        "author": old_message.author.mention,
+                        "author": old_message.author_mention,
                         "content": old_message.content,
-                        "attachment amount": str(len(old_message.attachments)),
-                        "timestamp": old_message.timestamp.isoformat(),
+                        "attachment amount": str(old_message.attachments),
+                        "timestamp": old_message.timestamp,
                     }
                 ]
             }
@@ -122,6 +165,30 @@ class LoggingPlugin(HootPlugin):
                 "channel": "<#" + str(event.channel_id) + ">",
             }]}
 
+    @logging_wrapper("MessageDeleteBulk")
+    def log_bulk_delete(self, event):
+        lines, missing = [], 0
+        for msg_id in sorted(event.ids):  # Snowflakes sort chronologically
+            message = self.msg_cache.pop(msg_id) or self.get_msg(event.channel_id, msg_id)
+            if message is None:
+                missing += 1
+                lines.append("[{}] <not cached>".format(msg_id))
+                continue
+            line = "[{}] {}: {}".format(message.timestamp, message.author_id,
+                                           (message.content or "").replace("\n", "\n    "))
+            if message.attachments:
+                line += " (+{} attachments)".format(message.attachments)
+            lines.append(line)
+
+        return {
+            "file": ("transcript-{}.txt".format(event.channel_id), "\n".join(lines).encode()),
+            "parts": [{
+                "channel": "<#" + str(event.channel_id) + ">",
+                "message amount": str(len(event.ids)),
+                "not cached": str(missing)
+            }]
+        }
+
     @logging_wrapper("MessageUpdate")
     def on_msg_edit(self, event):
         payload = {
@@ -140,8 +207,8 @@ class LoggingPlugin(HootPlugin):
             payload['parts'].append({
                 "message": "*__old__*",
                 "content": old_msg.content,
-                "attachment amount": str(len(old_msg.attachments)),
-                "timestamp": old_msg.timestamp.isoformat()
+                "attachment amount": str(old_msg.attachments),
+                "timestamp": old_msg.timestamp
             })
 
         payload['parts'].append({
@@ -1,9 +1,9 @@
 from datetime import datetime, timedelta
 from time import time
-from weakref import WeakValueDictionary
 
 from models.mail import MailRoom
 from utils.base import HootPlugin
+from utils.scheduler import scheduler
 
 from disco.api.http import APIException
 from disco.bot import CommandLevels
@@ -14,27 +14,21 @@ from gevent.timeout import Timeout
 class MailPlugin(HootPlugin):
 
     def load(self, ctx):
-        self.room_greenlets = WeakValueDictionary()
         self.preping = []
-        self.channel_cache = []
+        scheduler.register("mail", self.expire_channel)
 
     def get_room(self, channel_id: int):
-        if channel_id in self.channel_cache:
-            return False, None
-
         try:
-            room = MailRoom.find_one(MailRoom.channel == channel_id)
+            room = MailRoom.find_one(MailRoom.channel == channel_id)  # Served from the model cache, misses included
         except IndexError:
-            self.channel_cache.append(channel_id)
-            if len(self.channel_cache) > self.config['max_cache']:
-                self.channel_cache.pop(0)
             return False, None
         return True, room
 
     @HootPlugin.listen("Ready")
     def setup_channels(self, event):
-        rooms = MailRoom.find_all()
-        for room in rooms:
+        for room in MailRoom.iter():
+            if scheduler.pending("mail", room.channel) is not None:  # Already persisted by the scheduler
+                continue
             try:
                 channel = self.client.api.channels_get(room.channel)
                 delta = (channel.get_message(channel.last_message_id).timestamp + timedelta(seconds=self.config["expiration"]) - datetime.now())
@@ -45,9 +39,17 @@ class MailPlugin(HootPlugin):
             if delta.days < 0:
                 self.expire_room(room)
             else:
-                self.room_greenlets[room.channel] = self.spawn_later(delta.seconds, self.expire_room, room)
+                scheduler.schedule("mail", room.channel, time() + delta.total_seconds())
+
+    def expire_channel(self, channel_id: int):
+        try:
+            room = MailRoom.find_one(MailRoom.channel == channel_id)
+        except IndexError:
+            return
+        self.expire_room(room)
 
     def expire_room(self, room: MailRoom):
+        scheduler.cancel("mail", room.channel)
         room.delete_self()
         self.client.api.channels_messages_create(room.user, self.config['closing_message'])
         self.client.api.channels_delete(room.channel)
@@ -68,7 +70,6 @@ class MailPlugin(HootPlugin):
         except IndexError:
             event.msg.reply(self.config["unknown_room"])
         else:
-            self.room_greenlets[room.channel].kill()
             self.expire_room(room)
 
     @HootPlugin.listen("MessageCreate")
@@ -112,9 +113,7 @@ class MailPlugin(HootPlugin):
         except IndexError:
             self.create_room(event)
         else:
-            if room.channel in self.room_greenlets:  # I shouldn't need to do this, but it doesn't hurt...
-                self.room_greenlets[room.channel].kill()
-            self.room_greenlets[room.channel] = self.spawn_later(self.config['expiration'], self.expire_room, room)
+            scheduler.schedule("mail", room.channel, time() + self.config['expiration'])
             self.client.api.channels_messages_create(room.channel, S(event.content) or "<No message>")
             if event.attachments:
                 self.client.api.channels_messages_create(room.channel, """__**Attachments:**__
@@ -155,8 +154,7 @@ class MailPlugin(HootPlugin):
             message=msg.content
         )
 
-        room = MailRoom.find_one(msg.channel_id)
-        self.room_greenlets[new_channel.id] = self.spawn_later(self.config["expiration"], self.expire_room, room)
+        scheduler.schedule("mail", new_channel.id, time() + self.config["expiration"])
         self.preping.remove(msg.author.id)
         self.log_action("Created Mail", "Created a new mail room {c.mention} with {t.mention}",
                         msg.author, c=new_channel)
@@ -2,6 +2,12 @@ from datetime import datetime
 from time import time
 
 from models.mutes import Mute
+from models.base import bootstrap
+from models.cache import cache
+from models.pool import pool
+from models.writebehind import writes
+from utils.outbox import outbox
+from utils.scheduler import scheduler
 
 from disco.bot.plugin import Plugin, CommandError
 from disco.bot import CommandLevels
@@ -13,6 +19,21 @@ import gevent
 class HootPlugin(Plugin):
     _shallow = True
 
+    def __init__(self, bot, config):
+        super().__init__(bot, config)
+        storage = config.get("STORAGE", {})
+        pool.configure(backend=storage.get("backend", "sqlite"), profile=storage.get("profile", {}),
+                       **storage.get("pool", {}))
+        writes.configure(**storage.get("write_behind", {}))
+        cache.configure(**storage.get("cache", {}))
+        bootstrap()
+        outbox.configure(client=bot.client, **config.get("LOG_OUTBOX", {}))
+
+    def unload(self, ctx):
+        writes.flush()
+        outbox.flush()
+        super().unload(ctx)
+
     @property
     def command_list(self):
         return map(lambda x: x.name, self.commands)
@@ -53,7 +74,7 @@ class HootPlugin(Plugin):
         else:
             embed.description = content.format(**kwargs)
         embed.timestamp = datetime.utcnow().isoformat()
-        self.client.api.channels_messages_create(self.config["BOT_LOGGING_CHANNEL"], " ", embed=embed)
+        outbox.post(self.config["BOT_LOGGING_CHANNEL"], embed)
 
     def dm(self, channel, *args, **kwargs):
         try:
@@ -61,13 +82,19 @@ class HootPlugin(Plugin):
         except APIException:
             pass
 
-    def unmute(self, member, force=False):
-        unmute = True
-        for mute in Mute.find(Mute.target == member.id):
-            if mute.end_time <= time() or force:
-                mute.delete_self()
-            else:
-                unmute = False
-        if unmute:
-            member.remove_role(self.config["MUTE_ROLE"])
-            self.log_action("Unmute", "Unmuted {t.mention}", member.user)
+    def unmute(self, member):
+        # Lifts every mute at once, timed expiries go through expire_mute instead
+        Mute.delete_where(Mute.target == member.id)
+        scheduler.cancel("unmute", member.id)
+        member.remove_role(self.config["MUTE_ROLE"])
+        self.log_action("Unmute", "Unmuted {t.mention}", member.user)
+
+    def schedule_unmute(self, user_id: int, end_time: float):
+        # One job per user, kept at their latest mute so an earlier one can't end a longer mute
+        scheduler.schedule("unmute", user_id, max(end_time, scheduler.pending("unmute", user_id) or 0))
+
+    def expire_mute(self, user_id: int):
+        Mute.delete_where(Mute.target == user_id, Mute.end_time <= time())
+        if not Mute.exists(Mute.target == user_id):
+            self.client.api.guilds_members_roles_remove(self.config['GUILD_ID'], user_id, self.config["MUTE_ROLE"])
+            self.log_action("Unmute", "Unmuted <@{u}>", u=user_id)
@@ -0,0 +1,106 @@
+from time import time
+import json
+import mmap
+import os
+import struct
+
+
+HEADER = struct.Struct("<QI")  # message id, payload length
+SEGMENT_SECONDS = 86400
+
+
+class MessageJournal:
+    # Append-only log of message records, one segment file per day. Only the id -> offset index lives in RAM,
+    # records are read back through a memory map and whole segments are unlinked once they pass retention.
+
+    def __init__(self, path: str = "message_journal", retention: float = 604800):
+        self.path = path
+        self.retention = retention
+        self.index = {}  # segment -> {message id: offset}, newest record wins
+        self.maps = {}  # segment -> mmap, remapped once the segment outgrows it
+        self.segment = None
+        self.file = None
+        self.dirty = False
+        os.makedirs(path, exist_ok=True)
+        for name in sorted(os.listdir(path)):
+            if name.endswith(".log") and name[:-4].isdigit():
+                self._load(int(name[:-4]))
+        self.prune()
+
+    def _segment_path(self, segment: int):
+        return os.path.join(self.path, "{}.log".format(segment))
+
+    def _load(self, segment: int):
+        offsets = self.index[segment] = {}
+        with open(self._segment_path(segment), "r+b") as file:
+            offset = 0
+            while True:
+                header = file.read(HEADER.size)
+                if len(header) < HEADER.size:
+                    break
+                msg_id, length = HEADER.unpack(header)
+                if len(file.read(length)) < length:
+                    break
+                offsets[msg_id] = offset
+                offset += HEADER.size + length
+            file.truncate(offset)  # Drop a record torn by a crash mid-write
+
+    def _roll(self, segment: int):
+        if self.file is not None:
+            self.file.close()
+        self.segment = segment
+        self.file = open(self._segment_path(segment), "ab")
+        self.index.setdefault(segment, {})
+        self.prune()
+
+    def append(self, msg_id: int, record):
+        segment = int(time() // SEGMENT_SECONDS)
+        if segment != self.segment:
+            self._roll(segment)
+        payload = json.dumps(record, separators=(",", ":")).encode()
+        self.index[segment][msg_id] = self.file.tell()
+        self.file.write(HEADER.pack(msg_id, len(payload)) + payload)
+        self.dirty = True
+
+    def get(self, msg_id: int):
+        for segment in sorted(self.index, reverse=True):
+            offset = self.index[segment].get(msg_id)
+            if offset is not None:
+                return self._read(segment, offset)
+        return None
+
+    def _read(self, segment: int, offset: int):
+        if self.dirty:  # Reads go through the page cache, so buffered appends must reach it first
+            self.file.flush()
+            self.dirty = False
+        view = self.maps.get(segment)
+        if view is None or offset + HEADER.size > len(view):
+            if view is not None:
+                view.close()
+            with open(self._segment_path(segment), "rb") as file:
+                view = self.maps[segment] = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        _, length = HEADER.unpack_from(view, offset)
+        start = offset + HEADER.size
+        if start + length > len(view):
+            del self.maps[segment]
+            view.close()
+            return self._read(segment, offset)
+        return json.loads(view[start:start + length])
+
+    def prune(self):
+        oldest = int((time() - self.retention) // SEGMENT_SECONDS)
+        for segment in [segment for segment in self.index if segment < oldest]:
+            del self.index[segment]
+            view = self.maps.pop(segment, None)
+            if view is not None:
+                view.close()
+            os.remove(self._segment_path(segment))
+
+    def close(self):
+        for view in self.maps.values():
+            view.close()
+        self.maps.clear()
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+            self.segment = None
@@ -0,0 +1,53 @@
+from collections import OrderedDict
+
+
+class LRUCache(OrderedDict):
+    # Dict lookups with insertion-ordered eviction, so every operation is O(1) instead of a deque scan
+
+    def __init__(self, max_size: int):
+        super().__init__()
+        self.max_size = max_size
+
+    def put(self, key, value):
+        """Stores value as the most recent entry and returns the (key, value) pairs evicted to make room."""
+        self[key] = value
+        self.move_to_end(key)
+        evicted = []
+        while len(self) > self.max_size:
+            evicted.append(self.popitem(last=False))
+        return evicted
+
+
+class MessageCache:
+    # Bounded per channel like the old deque(maxlen) windows, with a global id -> channel index on top
+
+    def __init__(self, max_per_channel: int):
+        self.max_per_channel = max_per_channel
+        self.channels = {}  # channel id -> LRUCache of message id -> message
+        self.index = {}  # message id -> channel id
+
+    def __len__(self):
+        return len(self.index)
+
+    def get(self, msg_id: int, channel: int = None):
+        channel = self.index.get(msg_id) if channel is None else channel
+        messages = self.channels.get(channel)
+        return None if messages is None else messages.get(msg_id)
+
+    def put(self, channel: int, msg_id: int, message):
+        messages = self.channels.get(channel)
+        if messages is None:
+            messages = self.channels[channel] = LRUCache(self.max_per_channel)
+        self.index[msg_id] = channel
+        for old_id, _ in messages.put(msg_id, message):
+            del self.index[old_id]
+
+    def pop(self, msg_id: int):
+        channel = self.index.pop(msg_id, None)
+        if channel is None:
+            return None
+        messages = self.channels[channel]
+        message = messages.pop(msg_id)
+        if not messages:
+            del self.channels[channel]
+        return message
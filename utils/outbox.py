@@ -0,0 +1,112 @@
+from collections import OrderedDict, deque
+import logging
+
+from disco.api.http import APIException, Routes
+import gevent
+from gevent.event import Event
+from gevent.lock import RLock
+
+
+log = logging.getLogger(__name__)
+
+MAX_EMBEDS = 10  # Per message
+MAX_EMBED_CHARS = 6000  # Across all embeds of a message
+
+
+def embed_size(embed: dict):
+    size = len(embed.get("title", "")) + len(embed.get("description", ""))
+    size += len(embed.get("footer", {}).get("text", "")) + len(embed.get("author", {}).get("name", ""))
+    return size + sum(len(field.get("name", "")) + len(field.get("value", "")) for field in embed.get("fields", ()))
+
+
+class Outbox:
+    # Log embeds are queued per channel and posted up to ten per message by one greenlet, so a raid or purge
+    # turns into a handful of requests paced by the API client's per-route rate limiter instead of blocking
+    # every handler on its own request.
+
+    def __init__(self, flush_interval: float = 1, max_pending: int = 500):
+        self.client = None
+        self.flush_interval = flush_interval
+        self.max_pending = max_pending
+        self.queues = OrderedDict()  # channel -> deque of embed dicts
+        self.size = 0
+        self.sent = 0
+        self.messages = 0
+        self.dropped = 0
+        self.failed = 0
+        self._wakeup = Event()
+        self._full = Event()
+        self._lock = RLock()
+        self._greenlet = None
+
+    def configure(self, client=None, flush_interval: float = None, max_pending: int = None):
+        if client is not None:
+            self.client = client
+        if flush_interval is not None:
+            self.flush_interval = flush_interval
+        if max_pending is not None:
+            self.max_pending = max_pending
+
+    def post(self, channel: int, embed):
+        if self.size >= self.max_pending:  # The API is behind, shed new entries rather than grow without bound
+            self.dropped += 1
+            return
+        queue = self.queues.setdefault(channel, deque())
+        queue.append(embed.to_dict())
+        self.size += 1
+        if len(queue) >= MAX_EMBEDS:
+            self._full.set()
+        if self._greenlet is None or self._greenlet.dead:
+            self._greenlet = gevent.spawn(self._run)
+        self._wakeup.set()
+
+    def _run(self):
+        while True:
+            self._wakeup.wait()
+            self._full.wait(self.flush_interval)
+            self._wakeup.clear()
+            self._full.clear()
+            try:
+                self.flush()
+            except Exception:
+                log.exception("Failed to flush log outbox")
+
+    def _batch(self, queue: deque):
+        batch, chars = [], 0
+        while queue and len(batch) < MAX_EMBEDS:
+            size = embed_size(queue[0])
+            if batch and chars + size > MAX_EMBED_CHARS:
+                break
+            batch.append(queue.popleft())
+            chars += size
+        self.size -= len(batch)
+        return batch
+
+    def flush(self):
+        with self._lock:  # One flusher at a time, e.g. unload racing the background greenlet, keeps posts in order
+            for channel, queue in list(self.queues.items()):
+                while queue:
+                    batch = self._batch(queue)
+                    try:
+                        self.client.api.http(Routes.CHANNELS_MESSAGES_CREATE, dict(channel=channel),
+                                             json={"embeds": batch})
+                    except APIException:
+                        log.exception("Failed to post %d log embeds to %s", len(batch), channel)
+                        self.failed += len(batch)
+                    else:
+                        self.sent += len(batch)
+                        self.messages += 1
+                if not queue:
+                    del self.queues[channel]
+
+    def stats(self):
+        return {
+            "queued": self.size,
+            "sent": self.sent,
+            "messages": self.messages,
+            "dropped": self.dropped,
+            "failed": self.failed
+        }
+
+
+outbox = Outbox()
@@ -0,0 +1,98 @@
+from time import time
+import heapq
+import logging
+
+from models.base import MAX_VARIABLES
+from models.jobs import Job
+
+import gevent
+from gevent.event import Event
+from gevent.pool import Pool
+
+
+log = logging.getLogger(__name__)
+
+
+class Scheduler:
+    # One greenlet fires every timed job (unmutes, mail expiries, ...) off an in-memory min-heap. Jobs are
+    # persisted in the job table so they survive restarts, and are only removed once their handler has run.
+
+    def __init__(self, concurrency: int = 10):
+        self.handlers = {}
+        self.workers = Pool(concurrency)  # Bounds handlers when a backlog falls due at once, e.g. after downtime
+        self.due = {}  # (kind, key) -> due, the heap may hold stale entries for cancelled or moved jobs
+        self.heap = []
+        self.orphans = {}  # kind -> [(due, kind, key)] that fell due before a handler was registered
+        self._wakeup = Event()
+        self._greenlet = None
+
+    def start(self):
+        if self._greenlet is not None:
+            return
+        for job in Job.iter():
+            self.due[(job.kind, job.key)] = job.due
+        self.heap = [(due, kind, key) for (kind, key), due in self.due.items()]
+        heapq.heapify(self.heap)
+        self._greenlet = gevent.spawn(self._run)
+
+    def register(self, kind: str, handler):
+        self.handlers[kind] = handler
+        self.start()
+        for entry in self.orphans.pop(kind, ()):
+            self._push(entry)
+
+    def pending(self, kind: str, key: int):
+        return self.due.get((kind, key))
+
+    def schedule(self, kind: str, key: int, due: float):
+        self.start()
+        due = int(due)
+        with Job.transaction():
+            Job.delete_where(Job.kind == kind, Job.key == key)
+            Job.create(kind=kind, key=key, due=due)
+        self.due[(kind, key)] = due
+        self._push((due, kind, key))
+
+    def cancel(self, kind: str, key: int):
+        if self.due.pop((kind, key), None) is not None:
+            Job.delete_where(Job.kind == kind, Job.key == key)
+
+    def cancel_many(self, kind: str, keys):
+        keys = [key for key in keys if self.due.pop((kind, key), None) is not None]
+        for i in range(0, len(keys), MAX_VARIABLES):
+            Job.delete_where(Job.kind == kind, Job.key.in_(keys[i:i + MAX_VARIABLES]))
+
+    def _push(self, entry):
+        heapq.heappush(self.heap, entry)
+        if len(self.heap) > 2 * len(self.due) + 64:  # Drop stale entries left behind by reschedules
+            self.heap = [(due, kind, key) for (kind, key), due in self.due.items()]
+            heapq.heapify(self.heap)
+        if self.heap[0] == entry:
+            self._wakeup.set()
+
+    def _run(self):
+        while True:
+            self._wakeup.clear()
+            now = time()
+            while self.heap and self.heap[0][0] <= now:
+                entry = heapq.heappop(self.heap)
+                due, kind, key = entry
+                if self.due.get((kind, key)) != due:
+                    continue
+                if kind not in self.handlers:
+                    self.orphans.setdefault(kind, []).append(entry)
+                    continue
+                del self.due[(kind, key)]
+                self.workers.spawn(self._fire, kind, key, due)
+            self._wakeup.wait(self.heap[0][0] - now if self.heap else None)
+
+    def _fire(self, kind, key, due):
+        try:
+            self.handlers[kind](key)
+        except Exception:
+            log.exception("Scheduled %s job for %s failed", kind, key)
+        finally:
+            Job.delete_where(Job.kind == kind, Job.key == key, Job.due == due)
+
+
+scheduler = Scheduler()